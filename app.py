@@ -1,11 +1,20 @@
-import os
-import tempfile
+import asyncio
+import hashlib
 
 import streamlit as st
 import plotly.express as px
 
 from pipeline import run_analysis_pipeline
-from llm_engine import client, MODEL_NAME
+import llm_cache
+from llm_engine import (
+    ENGINE_ERROR_PREFIX,
+    MODEL_NAME,
+    PROMPT_VERSION,
+    build_negotiation_prompt,
+    generate_negotiation_tips_async,
+    stream_negotiation_tips,
+    run_async,
+)
 
 
 # ==========================
@@ -46,6 +55,9 @@ body {
 </style>
 """, unsafe_allow_html=True)
 
+# Anything else (e.g. "Unknown") renders as high risk
+RISK_CSS = {"Low": "risk-low", "Medium": "risk-medium"}
+
 # ==========================
 # SIDEBAR
 # ==========================
@@ -77,186 +89,248 @@ with col_right:
         "Select Contract Type",
         ["Employment", "NDA", "Service", "Vendor", "Lease"],
     )
+    language = st.selectbox(
+        "Summary Language",
+        ["English", "Hindi", "Telugu", "Spanish"]
+    )
 
 run_button = st.button("🚀 Run Full Analysis")
 
 # ==========================
-# NEGOTIATION FUNCTION
+# CACHED ANALYSIS
 # ==========================
 
-def generate_negotiation_tips(contract_type: str, report: dict):
-    try:
-        clauses_summary = "\n".join(
-            [f"- {c['title']} ({c['risk_level']})" for c in report.get("clauses", [])]
-        )
-        missing = report.get("missing_clauses", [])
+class IncompleteReport(Exception):
+    """
+    Raised out of the cached analyze() so st.cache_data skips the entry.
+    """
 
-        prompt = f"""
-You are a contract lawyer.
+    def __init__(self, report):
+        super().__init__("report has clauses without a risk verdict")
+        self.report = report
 
-Contract type: {contract_type}
 
-Clause risks:
-{clauses_summary}
+@st.cache_data(show_spinner=False, max_entries=32)
+def analyze(file_hash: str, contract_type: str, _pdf_bytes: bytes):
+    # Keyed on (file_hash, contract_type); the leading underscore keeps
+    # Streamlit from re-hashing the raw PDF bytes on every rerun.
+    report = run_analysis_pipeline(_pdf_bytes, contract_type)
 
-Missing clauses:
-{missing}
+    # Failed or incomplete LLM answers (e.g. a transient 429) must not
+    # stick; exceptions are never cached, so the next Run retries
+    if any(
+        c["risk_level"] == "Unknown" or c["explanation"].startswith(ENGINE_ERROR_PREFIX)
+        for c in report.get("clauses", [])
+    ):
+        raise IncompleteReport(report)
 
-Provide:
-1. 3 bullet summary of overall risk posture.
-2. 3–5 practical negotiation improvements.
-Keep concise.
-"""
+    return report
 
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are concise and practical."},
-                {"role": "user", "content": prompt},
-            ],
-            model=MODEL_NAME,
-            max_tokens=300,
-        )
-
-        return response.choices[0].message.content.strip()
+# ==========================
+# TIPS CACHE
+# ==========================
 
-    except:
-        return "Negotiation tips unavailable due to API limits."
+def tips_cache_key(prompt: str):
+    # The prompt carries every report-specific input (contract type, clause
+    # risks, missing clauses, language), so only an exact match is safe
+    return llm_cache.make_key("tips", PROMPT_VERSION, MODEL_NAME, prompt)
 
 # ==========================
-# TRANSLATION FUNCTION
+# NEGOTIATION FUNCTION
 # ==========================
 
-def translate_text(text, target_language):
-    try:
-        prompt = f"Translate the following text into {target_language}:\n\n{text}"
-
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a professional translator."},
-                {"role": "user", "content": prompt}
-            ],
-            model=MODEL_NAME,
-            max_tokens=400
+def generate_negotiation_tips(contract_type: str, report: dict, language: str = "English"):
+    """
+    Returns {language: tips}. English is always included; for any other
+    language the localized tips are requested alongside the English ones
+    (concurrently) instead of translating them afterwards.
+    """
+    languages = ["English"] if language == "English" else ["English", language]
+
+    tips = {}
+    pending = {}
+
+    for lang in languages:
+        prompt = build_negotiation_prompt(contract_type, report, lang)
+        cached = llm_cache.get(tips_cache_key(prompt))
+        if cached is not None:
+            tips[lang] = cached
+        else:
+            pending[lang] = prompt
+
+    if not pending:
+        return tips
+
+    async def fetch_all(async_client, semaphore):
+        return await asyncio.gather(
+            *(
+                generate_negotiation_tips_async(
+                    async_client,
+                    semaphore,
+                    prompt,
+                    # Non-Latin scripts need more tokens for the same text
+                    max_tokens=300 if lang == "English" else 400,
+                )
+                for lang, prompt in pending.items()
+            ),
+            return_exceptions=True,
         )
 
-        return response.choices[0].message.content.strip()
+    try:
+        results = run_async(fetch_all)
+    except Exception as e:
+        results = [e] * len(pending)
+
+    for (lang, prompt), result in zip(pending.items(), results):
+        if isinstance(result, Exception):
+            tips[lang] = "Negotiation tips unavailable due to API limits."
+        else:
+            llm_cache.put(tips_cache_key(prompt), result)
+            tips[lang] = result
+
+    return tips
+
+
+def write_negotiation_tips(contract_type: str, report: dict):
+    """
+    English-only path: stream the tips into the page as they are generated.
+    """
+    prompt = build_negotiation_prompt(contract_type, report)
+    cache_key = tips_cache_key(prompt)
 
-    except:
-        return "Translation unavailable due to API limits."
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        st.write(cached)
+        return
+
+    try:
+        tips = st.write_stream(stream_negotiation_tips(prompt))
+        llm_cache.put(cache_key, tips.strip())
+    except Exception:
+        st.write("Negotiation tips unavailable due to API limits.")
 
 # ==========================
 # MAIN LOGIC
 # ==========================
 
+if uploaded_file is not None:
+    pdf_bytes = uploaded_file.getvalue()
+    current_inputs = (hashlib.md5(pdf_bytes).hexdigest(), contract_type)
+else:
+    current_inputs = None
+
+# Remember what Run was pressed for. Reruns keep the results on screen
+# only while the file and contract type still match (e.g. changing the
+# language); a new upload or contract type waits for another click.
 if run_button:
-    if uploaded_file is None:
+    st.session_state["analysis_inputs"] = current_inputs
+    st.session_state.pop("incomplete_report", None)
+    if current_inputs is None:
         st.error("Please upload a PDF.")
-    else:
-        with st.spinner("Analyzing contract..."):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                tmp.write(uploaded_file.read())
-                tmp_path = tmp.name
 
-            try:
-                report = run_analysis_pipeline(tmp_path, contract_type)
-            finally:
-                os.remove(tmp_path)
+if current_inputs is not None and st.session_state.get("analysis_inputs") == current_inputs:
+    file_hash = current_inputs[0]
 
-        st.markdown("---")
+    # An incomplete report isn't cached by analyze(); it is kept here so
+    # language-only reruns don't repeat the LLM calls, and Run retries it
+    report = st.session_state.get("incomplete_report")
 
-        clauses = report.get("clauses", [])
-        missing = report.get("missing_clauses", [])
-
-        # ==========================
-        # OVERALL RISK INDEX
-        # ==========================
+    if report is None:
+        with st.spinner("Analyzing contract..."):
+            try:
+                report = analyze(file_hash, contract_type, pdf_bytes)
+            except IncompleteReport as e:
+                report = e.report
+                st.session_state["incomplete_report"] = report
 
-        if clauses:
-            risk_map = {"Low": 1, "Medium": 2, "High": 3}
-            scores = [risk_map.get(c["risk_level"], 2) for c in clauses]
-            overall_score = round(sum(scores) / len(scores), 2)
+    st.markdown("---")
 
-            st.subheader("🚨 Overall Risk Index")
+    clauses = report.get("clauses", [])
+    missing = report.get("missing_clauses", [])
 
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Risk Score (1=Low, 3=High)", overall_score)
-            with col2:
-                st.progress(overall_score / 3)
+    # ==========================
+    # OVERALL RISK INDEX
+    # ==========================
 
-        # ==========================
-        # MISSING CLAUSES
-        # ==========================
+    if clauses:
+        risk_map = {"Low": 1, "Medium": 2, "High": 3}
+        scores = [risk_map.get(c["risk_level"], 2) for c in clauses]
+        overall_score = round(sum(scores) / len(scores), 2)
 
-        st.subheader("📌 Missing Clause Types")
+        st.subheader("🚨 Overall Risk Index")
 
-        if missing:
-            for m in missing:
-                st.warning(m)
-        else:
-            st.success("All required clauses found.")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Risk Score (1=Low, 3=High)", overall_score)
+        with col2:
+            st.progress(overall_score / 3)
 
-        # ==========================
-        # CLAUSE CARDS
-        # ==========================
+    # ==========================
+    # MISSING CLAUSES
+    # ==========================
 
-        st.subheader("📊 Clause Risk Assessment")
+    st.subheader("📌 Missing Clause Types")
 
-        for c in clauses:
-            risk = c["risk_level"]
-            css_class = (
-                "risk-low" if risk == "Low"
-                else "risk-medium" if risk == "Medium"
-                else "risk-high"
-            )
-
-            st.markdown(f"""
-            <div class="block-card">
-                <h4>{c['title']}</h4>
-                <p>Risk Level: <span class="{css_class}">{risk}</span></p>
-                <p>{c['explanation']}</p>
-            </div>
-            """, unsafe_allow_html=True)
+    if missing:
+        for m in missing:
+            st.warning(m)
+    else:
+        st.success("All required clauses found.")
+
+    # ==========================
+    # CLAUSE CARDS
+    # ==========================
+
+    st.subheader("📊 Clause Risk Assessment")
+
+    # One markdown message for all cards instead of one per clause
+    cards_html = "\n".join(
+        f'<div class="block-card">'
+        f'<h4>{c["title"]}</h4>'
+        f'<p>Risk Level: <span class="{RISK_CSS.get(c["risk_level"], "risk-high")}">{c["risk_level"]}</span></p>'
+        f'<p>{c["explanation"]}</p>'
+        f'</div>'
+        for c in clauses
+    )
 
-        # ==========================
-        # RISK DISTRIBUTION
-        # ==========================
+    if cards_html:
+        st.markdown(cards_html, unsafe_allow_html=True)
 
-        if clauses:
-            risk_counts = {}
-            for c in clauses:
-                risk_counts[c["risk_level"]] = risk_counts.get(c["risk_level"], 0) + 1
+    # ==========================
+    # RISK DISTRIBUTION
+    # ==========================
 
-            fig = px.bar(
-                x=list(risk_counts.keys()),
-                y=list(risk_counts.values()),
-                labels={"x": "Risk Level", "y": "Count"},
-                title="Risk Distribution",
-                color=list(risk_counts.keys()),
-            )
+    if clauses:
+        risk_counts = {}
+        for c in clauses:
+            risk_counts[c["risk_level"]] = risk_counts.get(c["risk_level"], 0) + 1
+
+        fig = px.bar(
+            x=list(risk_counts.keys()),
+            y=list(risk_counts.values()),
+            labels={"x": "Risk Level", "y": "Count"},
+            title="Risk Distribution",
+            color=list(risk_counts.keys()),
+        )
 
-            st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(fig, use_container_width=True)
 
-        # ==========================
-        # NEGOTIATION TIPS
-        # ==========================
+    # ==========================
+    # NEGOTIATION TIPS
+    # ==========================
 
-        st.subheader("🤝 Negotiation Tips & Summary")
+    st.subheader("🤝 Negotiation Tips & Summary")
 
-        tips = generate_negotiation_tips(contract_type, report)
-        st.write(tips)
+    if language == "English":
+        write_negotiation_tips(contract_type, report)
+    else:
+        # Both versions are generated concurrently, then shown together
+        tips = generate_negotiation_tips(contract_type, report, language)
+        st.write(tips["English"])
 
         # ==========================
         # LANGUAGE CONVERSION
         # ==========================
 
-        st.subheader("🌍 Convert Summary Language")
-
-        language = st.selectbox(
-            "Select Language",
-            ["English", "Hindi", "Telugu", "Spanish"]
-        )
-
-        if language != "English":
-            translated = translate_text(tips, language)
-            st.write(translated)
\ No newline at end of file
+        st.subheader(f"🌍 Summary in {language}")
+        st.write(tips[language])
\ No newline at end of file
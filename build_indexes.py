@@ -0,0 +1,32 @@
+import os
+import sys
+
+# ==========================================
+# OFFLINE INDEX BUILD
+# Encodes every precedent once and writes
+# precedents_<hash>.npy + .json (and .faiss when a
+# FAISS index is used) so the app can mmap them at
+# startup instead of re-encoding. The app also saves
+# them itself after its first encode; this prebuilds
+# them, e.g. into a container image. Files saved for
+# older precedents with the same encoder settings
+# are removed.
+# ==========================================
+
+# Skip the import-time build; it would encode the corpus a second time
+# and save it into the default INDEX_DIR
+os.environ["OCV_DEFER_INDEX_BUILD"] = "1"
+
+from retrieval_engine import INDEX_DIR, build_indexes, save_indexes
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: python build_indexes.py [output_dir]")
+        sys.exit(1)
+
+    output_dir = sys.argv[1] if len(sys.argv) == 2 else INDEX_DIR
+
+    build_indexes(use_saved=False)
+    save_indexes(output_dir)
+
+    print(f"Saved indexes to: {output_dir}")
@@ -1,8 +1,35 @@
 import re
 import json
-import pdfplumber
+import pypdfium2 as pdfium
 import sys
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Union
+
+from cpu_utils import available_cpus
+
+
+# Each worker process should get at least this many pages, otherwise
+# start-up costs more than the parallel extraction saves
+MIN_PAGES_PER_WORKER = 16
+
+# The app process already runs torch, FAISS (OpenMP) and warm-up threads;
+# forking it can deadlock, so workers start from a clean interpreter
+_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+# -----------------------------
+# Compiled Patterns
+# -----------------------------
+
+_NEWLINES_RE = re.compile(r"\n+")
+# Split on double newlines or numbered headings like '1.' / '2.1'
+_SPLIT_RE = re.compile(r"(?:\n{2,}|^\d{1,2}\.\s|^\d{1,2}\.\d{1,2}\s)", re.MULTILINE)
+# Stray list markers such as 'a', 'ii', 'iv'
+_NOISE_RE = re.compile(r"[a-zA-Z]|i+|v+|x+")
 
 
 # -----------------------------
@@ -14,7 +41,13 @@ def preprocess_text(text: str) -> str:
     Normalize spacing while preserving structural newlines.
     """
     text = text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"[ \t]+", " ", text)
+
+    # Collapse runs of spaces/tabs with C-level str.replace; each pass
+    # halves every run, so only a few passes are ever needed
+    text = text.replace("\t", " ")
+    while "  " in text:
+        text = text.replace("  ", " ")
+
     return text.strip()
 
 
@@ -22,19 +55,67 @@ def preprocess_text(text: str) -> str:
 # PDF Reader
 # -----------------------------
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    if not os.path.exists(pdf_path):
-        raise FileNotFoundError(f"File '{pdf_path}' not found.")
+def _page_text(page) -> str:
+    textpage = page.get_textpage()
+    try:
+        text = textpage.get_text_range()
+    finally:
+        textpage.close()
+
+    # PDFium pads lines with spaces; strip them so numbered headings
+    # still start at column 0 for split_into_clauses
+    return "\n".join(line.strip() for line in text.splitlines())
+
+
+def _extract_page_range(source: Union[str, bytes], start: int, stop: int):
+    # Runs in a worker process: PDFium is not thread-safe, but each
+    # process gets its own document handle
+    pdf = pdfium.PdfDocument(source)
+    try:
+        texts = []
+        for i in range(start, stop):
+            page = pdf[i]
+            texts.append(_page_text(page))
+            page.close()
+        return texts
+    finally:
+        pdf.close()
+
+
+def extract_text_from_pdf(source: Union[str, bytes, BinaryIO]) -> str:
+    """
+    source: file path, raw PDF bytes, or a binary file-like object
+    (e.g. a Streamlit upload), so uploads never touch the disk.
+    """
+    if isinstance(source, str):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"File '{source}' not found.")
+    elif not isinstance(source, bytes):
+        # File-like objects can't be shared with worker processes
+        source = source.read()
+
+    pdf = pdfium.PdfDocument(source)
+    try:
+        n_pages = len(pdf)
+    finally:
+        pdf.close()
+
+    workers = min(available_cpus(), n_pages // MIN_PAGES_PER_WORKER)
 
-    text = ""
+    if workers < 2:
+        page_texts = _extract_page_range(source, 0, n_pages)
+    else:
+        # One contiguous page range per worker, so each process opens
+        # the document only once
+        step = (n_pages + workers - 1) // workers
+        starts = list(range(0, n_pages, step))
+        stops = [min(start + step, n_pages) for start in starts]
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n\n"
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_POOL_CONTEXT) as executor:
+            chunks = executor.map(_extract_page_range, [source] * len(starts), starts, stops)
+            page_texts = [text for chunk in chunks for text in chunk]
 
-    return text
+    return "".join(text + "\n\n" for text in page_texts if text)
 
 
 # -----------------------------
@@ -47,8 +128,7 @@ def split_into_clauses(text: str):
     - Double newlines
     - Numbered headings like '1.' or '2.1'
     """
-    pattern = r"(?:\n{2,}|^\d{1,2}\.\s|^\d{1,2}\.\d{1,2}\s)"
-    raw_clauses = re.split(pattern, text, flags=re.MULTILINE)
+    raw_clauses = _SPLIT_RE.split(text)
 
     cleaned_clauses = []
 
@@ -58,11 +138,11 @@ def split_into_clauses(text: str):
         if len(clause) < 50:
             continue
 
-        if re.fullmatch(r"[a-zA-Z]|i+|v+|x+", clause.lower()):
+        if _NOISE_RE.fullmatch(clause.lower()):
             continue
 
         # Remove internal line breaks for clean JSON output
-        clause = re.sub(r"\n+", " ", clause)
+        clause = _NEWLINES_RE.sub(" ", clause)
 
         cleaned_clauses.append(clause)
 
@@ -73,41 +153,27 @@ def split_into_clauses(text: str):
 # Classification (Priority-based)
 # -----------------------------
 
-def classify_clause(clause: str) -> str:
-    clause_lower = clause.lower()
-
+# (label, keywords) in priority order; the first rule with any keyword
+# present in the clause wins.
+CLAUSE_RULES = (
     # 1️⃣ Termination (highest priority)
-    if any(word in clause_lower for word in ["terminate", "termination"]):
-        return "Termination Clause"
-
+    ("Termination Clause", ("terminate", "termination")),
     # 2️⃣ Confidentiality
-    if "confidential" in clause_lower or "non-disclosure" in clause_lower:
-        return "Confidentiality Clause"
-
+    ("Confidentiality Clause", ("confidential", "non-disclosure")),
     # 3️⃣ Liability
-    if any(word in clause_lower for word in ["liability", "liable", "indemnify", "indemnity"]):
-        return "Liability Clause"
-
+    ("Liability Clause", ("liability", "liable", "indemnify", "indemnity")),
     # 4️⃣ Intellectual Property
-    if any(word in clause_lower for word in ["intellectual property", "ip rights", "copyright", "trademark"]):
-        return "Intellectual Property Clause"
-
+    ("Intellectual Property Clause", ("intellectual property", "ip rights", "copyright", "trademark")),
     # 5️⃣ Governing Law (strict detection)
-    if "governing law" in clause_lower or "governed by the laws" in clause_lower:
-        return "Governing Law Clause"
-
+    ("Governing Law Clause", ("governing law", "governed by the laws")),
     # 6️⃣ Notice
-    if any(word in clause_lower for word in ["notice shall", "written notice", "registered mail"]):
-        return "Notice Clause"
-
+    ("Notice Clause", ("notice shall", "written notice", "registered mail")),
     # 7️⃣ Assignment (avoid false positive from "successors and assigns")
-    if "may not assign" in clause_lower or "assign this agreement" in clause_lower:
-        return "Assignment Clause"
-
+    ("Assignment Clause", ("may not assign", "assign this agreement")),
     # 8️⃣ Payment / Compensation
-    if any(
-        word in clause_lower
-        for word in [
+    (
+        "Payment Clause",
+        (
             "payment",
             "salary",
             "fee",
@@ -116,9 +182,19 @@ def classify_clause(clause: str) -> str:
             "consideration",
             "wage",
             "remuneration",
-        ]
-    ):
-        return "Payment Clause"
+        ),
+    ),
+)
+
+
+def classify_clause(clause: str) -> str:
+    clause_lower = clause.lower()
+
+    # Plain loops over C-level substring search; no per-rule generator
+    for label, keywords in CLAUSE_RULES:
+        for word in keywords:
+            if word in clause_lower:
+                return label
 
     return "Other"
 
@@ -127,8 +203,8 @@ def classify_clause(clause: str) -> str:
 # Main Extraction
 # -----------------------------
 
-def extract_clauses_from_pdf(pdf_path: str):
-    contract_text = extract_text_from_pdf(pdf_path)
+def extract_clauses_from_pdf(source: Union[str, bytes, BinaryIO]):
+    contract_text = extract_text_from_pdf(source)
     cleaned_text = preprocess_text(contract_text)
     clauses = split_into_clauses(cleaned_text)
 
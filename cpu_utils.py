@@ -0,0 +1,16 @@
+import os
+
+# ==========================================
+# CPU BUDGET
+# Shared by clause_extraction (PDF worker processes)
+# and retrieval_engine (torch / FAISS threads); kept
+# free of heavy imports so PDF workers start fast.
+# ==========================================
+
+
+def available_cpus():
+    try:
+        # Respects container / taskset CPU limits
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS / Windows
+        return os.cpu_count() or 1
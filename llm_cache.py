@@ -0,0 +1,93 @@
+import os
+import time
+import sqlite3
+import hashlib
+from contextlib import closing
+
+import orjson
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+
+CACHE_PATH = os.getenv(
+    "OCV_LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache.sqlite3")
+)
+DEFAULT_TTL = 7 * 24 * 3600  # One week
+
+
+# ==========================================
+# CACHE KEY
+# ==========================================
+
+def make_key(*parts):
+    """
+    Content-addressed key: SHA-256 of the parts joined with '|'.
+    """
+    raw = "|".join(str(part) for part in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ==========================================
+# SQLITE BACKEND
+# ==========================================
+
+def _connect():
+    # One short-lived connection per call keeps this safe across
+    # Streamlit's script threads.
+    conn = sqlite3.connect(CACHE_PATH)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """
+    )
+    return conn
+
+
+def get(key):
+    """
+    Return the cached value for key, or None on miss / expiry.
+    Cache failures are treated as a miss.
+    """
+    try:
+        with closing(_connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at < time.time():
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+
+            return orjson.loads(value)
+
+    except (sqlite3.Error, ValueError):
+        return None
+
+
+def put(key, value, expire=DEFAULT_TTL):
+    """
+    Store a JSON-serializable value under key for `expire` seconds.
+    """
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (
+                    key,
+                    # risk maps are keyed by int clause numbers
+                    orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode(),
+                    time.time() + expire,
+                ),
+            )
+    except sqlite3.Error:
+        pass
@@ -1,6 +1,10 @@
 import os
-import json
-from groq import Groq
+import asyncio
+
+import orjson
+from groq import Groq, AsyncGroq
+
+import llm_cache
 
 # ==========================================
 # CONFIGURATION
@@ -15,6 +19,33 @@ client = Groq(api_key=api_key)
 # Llama 3 70B is used for legal reasoning
 MODEL_NAME = "openai/gpt-oss-20b"
 
+# Bump whenever build_batch_prompt changes so cached results are invalidated
+PROMPT_VERSION = "v2"
+
+# Compact output schema: single-letter risk levels, short explanations
+RISK_LEVELS = {"L": "Low", "M": "Medium", "H": "High"}
+MAX_EXPLANATION_CHARS = 120
+
+# Output cap for the batch call. gpt-oss spends hidden reasoning tokens
+# out of the same budget, so it gets a fixed allowance on top of the
+# per-clause answer tokens.
+OUTPUT_TOKENS_PER_CLAUSE = 60
+REASONING_TOKEN_BUDGET = 1024
+
+# Upper bound on in-flight Groq requests per run (rate-limit safety)
+MAX_CONCURRENT_REQUESTS = 8
+# Large contracts are split into requests of this many clauses
+CLAUSES_PER_REQUEST = 10
+
+# Explanations of clauses whose LLM call failed start with this
+ENGINE_ERROR_PREFIX = "Groq Engine Error: "
+
+# Verdict for "Other" clauses with no precedents; these skip the LLM
+SKIPPED_CLAUSE_VERDICT = {
+    "risk_level": "Low",
+    "explanation": "No precedents; likely boilerplate."
+}
+
 
 # ==========================================
 # PROMPT BUILDER (BATCH)
@@ -62,17 +93,13 @@ Below are multiple clauses from this contract and their closest precedent clause
 For EACH clause, you must:
 1. Compare the clause with its precedents.
 2. Identify deviations that increase legal or financial risk.
-3. Assign a risk level: "Low", "Medium", or "High".
-4. Provide a concise explanation (maximum 2 sentences).
+3. Assign a risk level: "L" (Low), "M" (Medium), or "H" (High).
+4. Provide a concise explanation (maximum {MAX_EXPLANATION_CHARS} characters).
 
 Return ONLY a valid JSON object with this exact structure:
 {{
   "results": [
-    {{
-      "clause_number": <number>,
-      "risk_level": "Low/Medium/High",
-      "explanation": "Short explanation text"
-    }},
+    {{"n": <clause number>, "r": "L|M|H", "e": "<explanation>"}},
     ...
   ]
 }}
@@ -83,23 +110,91 @@ Clauses:
 
 
 # ==========================================
-# BATCH ANALYSIS FUNCTION
+# PROMPT BUILDER (NEGOTIATION)
 # ==========================================
 
-def analyze_batch_risk(contract_type, enriched_clauses):
+def build_negotiation_prompt(contract_type, report, language="English"):
     """
-    Single LLM call for all clauses in a contract.
+    report: output of pipeline.run_analysis_pipeline
+    language: the tips are written directly in this language
+    """
+    clauses_summary = "\n".join(
+        [f"- {c['title']} ({c['risk_level']})" for c in report.get("clauses", [])]
+    )
+    missing = report.get("missing_clauses", [])
 
-    Returns:
-        risk_map: dict[int, dict]  # clause_number -> {risk_level, explanation}
+    return f"""
+You are a contract lawyer.
+
+Contract type: {contract_type}
+
+Clause risks:
+{clauses_summary}
+
+Missing clauses:
+{missing}
+
+Provide:
+1. 3 bullet summary of overall risk posture.
+2. 3–5 practical negotiation improvements.
+Keep concise. Write your answer in {language}.
+"""
+
+
+# ==========================================
+# ASYNC HELPERS
+# ==========================================
+
+def run_async(main):
+    """
+    Run main(async_client, semaphore) on a fresh event loop.
+
+    AsyncGroq's connection pool and asyncio.Semaphore are bound to the loop
+    that uses them, so both are created per run.
+    """
+    async def runner():
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        async with AsyncGroq(api_key=api_key) as async_client:
+            return await main(async_client, semaphore)
+
+    return asyncio.run(runner())
+
+
+async def _chat_async(async_client, semaphore, messages, **kwargs):
+    async with semaphore:
+        chat_completion = await async_client.chat.completions.create(
+            messages=messages,
+            model=MODEL_NAME,
+            **kwargs
+        )
+    return chat_completion.choices[0].message.content
+
+
+# ==========================================
+# BATCH ANALYSIS FUNCTION
+# ==========================================
+
+async def analyze_batch_risk_async(async_client, semaphore, contract_type, enriched_clauses):
+    """
+    Single LLM call for the given clauses. Shares the caller's client and
+    rate-limit semaphore, so several calls can run concurrently.
     """
     if not enriched_clauses:
         return {}
 
     prompt = build_batch_prompt(contract_type, enriched_clauses)
 
+    # Identical prompts (repeat uploads, dev reruns) are served from disk
+    cache_key = llm_cache.make_key(PROMPT_VERSION, MODEL_NAME, contract_type, prompt)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        # JSON object keys come back as strings
+        return {int(num): data for num, data in cached.items()}
+
     try:
-        chat_completion = client.chat.completions.create(
+        content = await _chat_async(
+            async_client,
+            semaphore,
             messages=[
                 {
                     "role": "system",
@@ -110,27 +205,33 @@ def analyze_batch_risk(contract_type, enriched_clauses):
                     "content": prompt
                 }
             ],
-            model=MODEL_NAME,
             # We expect a JSON object with a "results" array
-            response_format={"type": "json_object"}
+            response_format={"type": "json_object"},
+            reasoning_effort="low",
+            max_tokens=REASONING_TOKEN_BUDGET + OUTPUT_TOKENS_PER_CLAUSE * len(enriched_clauses)
         )
 
-        content = chat_completion.choices[0].message.content
-        parsed = json.loads(content)
+        parsed = orjson.loads(content)
 
-        # Expect: {"results": [ {...}, {...} ]}
+        # Expect: {"results": [ {"n": ..., "r": ..., "e": ...}, ... ]}
         results = parsed.get("results", [])
         risk_map = {}
 
         for item in results:
-            num = item.get("clause_number")
+            num = item.get("n")
             if num is None:
                 continue
+            # Tolerates "Low" etc. as well as the requested "L"
+            level = str(item.get("r", "")).strip()[:1].upper()
             risk_map[int(num)] = {
-                "risk_level": item.get("risk_level", "Unknown"),
-                "explanation": item.get("explanation", "Analysis complete.")
+                "risk_level": RISK_LEVELS.get(level, "Unknown"),
+                "explanation": item.get("e", "Analysis complete.")
             }
 
+        # Partial answers aren't cached, so omitted clauses get retried
+        if all(item["clause_number"] in risk_map for item in enriched_clauses):
+            llm_cache.put(cache_key, risk_map)
+
         return risk_map
 
     except Exception as e:
@@ -138,7 +239,86 @@ def analyze_batch_risk(contract_type, enriched_clauses):
         return {
             item["clause_number"]: {
                 "risk_level": "High",
-                "explanation": f"Groq Engine Error: {str(e)}"
+                "explanation": f"{ENGINE_ERROR_PREFIX}{str(e)}"
             }
             for item in enriched_clauses
         }
+
+
+def analyze_batch_risk(contract_type, enriched_clauses):
+    """
+    Risk analysis for all clauses in a contract, sent as concurrent
+    requests of up to CLAUSES_PER_REQUEST clauses each. Unclassified
+    clauses without precedents get SKIPPED_CLAUSE_VERDICT instead.
+
+    Returns:
+        risk_map: dict[int, dict]  # clause_number -> {risk_level, explanation}
+    """
+    risk_map = {}
+    llm_items = []
+
+    for item in enriched_clauses:
+        if item["clause_type"] == "Other" and not item.get("similar_clauses"):
+            risk_map[item["clause_number"]] = dict(SKIPPED_CLAUSE_VERDICT)
+        else:
+            llm_items.append(item)
+
+    if not llm_items:
+        return risk_map
+
+    chunks = [
+        llm_items[i:i + CLAUSES_PER_REQUEST]
+        for i in range(0, len(llm_items), CLAUSES_PER_REQUEST)
+    ]
+
+    async def analyze_all(async_client, semaphore):
+        return await asyncio.gather(
+            *(
+                analyze_batch_risk_async(async_client, semaphore, contract_type, chunk)
+                for chunk in chunks
+            )
+        )
+
+    for chunk_map in run_async(analyze_all):
+        risk_map.update(chunk_map)
+
+    return risk_map
+
+
+# ==========================================
+# NEGOTIATION TIPS
+# ==========================================
+
+async def generate_negotiation_tips_async(async_client, semaphore, prompt, max_tokens=300):
+    """
+    prompt: output of build_negotiation_prompt
+    """
+    content = await _chat_async(
+        async_client,
+        semaphore,
+        messages=[
+            {"role": "system", "content": "You are concise and practical."},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=max_tokens,
+    )
+    return content.strip()
+
+
+def stream_negotiation_tips(prompt, max_tokens=300):
+    """
+    Yield the tips chunk by chunk as Groq generates them (for st.write_stream).
+    """
+    completion = client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": "You are concise and practical."},
+            {"role": "user", "content": prompt},
+        ],
+        model=MODEL_NAME,
+        max_tokens=max_tokens,
+        stream=True,
+    )
+
+    for chunk in completion:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
@@ -1,5 +1,5 @@
 import os
-import json
+import orjson
 
 from clause_extraction import extract_clauses_from_pdf
 from retrieval_engine import process_clauses as find_similarities
@@ -50,23 +50,26 @@ REQUIRED_CLAUSES = {
 # MAIN PIPELINE
 # ==========================================
 
-def run_analysis_pipeline(pdf_path: str, contract_type: str):
+def run_analysis_pipeline(pdf_source, contract_type: str):
     """
+    pdf_source: file path, raw PDF bytes, or a binary file-like object
+
     End‑to‑end pipeline:
     1) Extract clauses from PDF
     2) Retrieve similar precedent clauses (FAISS)
-    3) Single batch LLM call for risk analysis
+    3) Batched LLM risk analysis (concurrent chunks of clauses)
     4) Compute missing clauses for this contract type
     """
 
-    print(f"\n--- 1. Extracting Clauses from: {pdf_path} ---")
-    extracted_raw = extract_clauses_from_pdf(pdf_path)
+    source_name = pdf_source if isinstance(pdf_source, str) else "uploaded PDF"
+    print(f"\n--- 1. Extracting Clauses from: {source_name} ---")
+    extracted_raw = extract_clauses_from_pdf(pdf_source)
 
     print(f"--- 2. Finding Similar Precedents for {contract_type} ---")
     enriched_clauses = find_similarities(extracted_raw, contract_type)
 
     print("--- 3. Performing Batch Risk Analysis with Groq ---")
-    # ONE Groq call for all clauses
+    # One Groq call per chunk of clauses, issued concurrently
     risk_map = analyze_batch_risk(contract_type, enriched_clauses)
     # risk_map: {clause_number: {risk_level, explanation}}
 
@@ -125,6 +128,6 @@ if __name__ == "__main__":
         print("\n" + "=" * 50)
         print("CONTRACT ANALYSIS FINAL REPORT")
         print("=" * 50)
-        print(json.dumps(final_report, indent=4, ensure_ascii=False))
+        print(orjson.dumps(final_report, option=orjson.OPT_INDENT_2).decode())
     else:
         print(f"Error: Could not find '{pdf_path}' in your directory.")
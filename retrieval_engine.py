@@ -1,7 +1,18 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import threading
+from contextlib import nullcontext
+
 import numpy as np
 import faiss
+import torch
 from sentence_transformers import SentenceTransformer
-from collections import defaultdict
+from collections import OrderedDict
+
+from cpu_utils import available_cpus
 
 # ==========================================
 # CONFIGURATION
@@ -11,12 +22,126 @@ MODEL_NAME = "all-MiniLM-L6-v2"
 EMBEDDING_DIM = 384
 TOP_K = 2
 SIMILARITY_THRESHOLD = 0.45  # Minimum cosine similarity to accept match
+ENCODE_BATCH_SIZE = 64
+EMBEDDING_CACHE_SIZE = 4096  # Query embeddings kept in memory (LRU)
+
+# Below this many precedents an exact numpy matmul beats FAISS call
+# overhead; larger corpora are searched through an HNSW graph
+HNSW_MIN_VECTORS = 10_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Above this many precedents the exact numpy search scores the corpus in
+# SEARCH_BLOCK_SIZE-row blocks (~384 KB each, cache resident) instead of
+# materializing every query's full score row
+BLOCKED_SEARCH_MIN_VECTORS = 4096
+SEARCH_BLOCK_SIZE = 256
+# Groups up to this many rows skip the HNSW graph and are scored exactly
+# (a matmul, or a scan of the quantized codes with sq8): a graph search
+# restricted to a narrow slice of the corpus silently loses recall.
+# Larger groups search the graph with efSearch widened by the share of
+# the corpus the filter rejects
+EXACT_GROUP_SIZE = 4096
+
+# "fp32" (exact) or "sq8": searches go through an 8-bit scalar-quantized
+# FAISS index, a quarter of the memory traffic. Scores drift by a few
+# thousandths, so matches right at SIMILARITY_THRESHOLD may flip and
+# near-ties may swap order. The FP32 corpus is still kept for saving; it
+# is memory-mapped when loaded from INDEX_DIR and never read by searches
+CORPUS_QUANTIZATION = os.getenv("OCV_CORPUS_QUANTIZATION", "fp32")
+
+# Prebuilt indexes written by build_indexes.py
+INDEX_DIR = os.getenv(
+    "OCV_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "indexes")
+)
+# Set by build_indexes.py, which builds and saves the corpus itself;
+# skips the import-time build and warm-up
+DEFER_INDEX_BUILD = os.getenv("OCV_DEFER_INDEX_BUILD") == "1"
+
+# "torch" (FP32 PyTorch) or "onnx" (dynamic-INT8 ONNX Runtime on CPU)
+EMBEDDING_BACKEND = os.getenv("OCV_EMBEDDING_BACKEND", "torch")
+# INT8 export shipped in the model repo; uses VNNI int8 GEMM where available
+ONNX_MODEL_FILE = os.getenv("OCV_ONNX_MODEL_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+
+# "fp32" or "bf16": bfloat16 autocast for the PyTorch encoder, faster on
+# CPUs with AVX512-BF16 / AMX. bf16 keeps ~3 significant digits, so
+# scores shift slightly and borderline matches may change
+ENCODER_PRECISION = os.getenv("OCV_ENCODER_PRECISION", "fp32")
+
+
+# Intra-op threads for the PyTorch encoder
+TORCH_THREADS = int(os.getenv("OCV_TORCH_THREADS", available_cpus()))
+# OpenMP threads for FAISS, which parallelizes across the queries of a
+# batched search; half the CPUs leaves room for the encoder
+FAISS_THREADS = int(os.getenv("OCV_FAISS_THREADS", max(1, available_cpus() // 2)))
 
 # ==========================================
 # LOAD EMBEDDING MODEL (ONCE)
 # ==========================================
 
-model = SentenceTransformer(MODEL_NAME)
+def configure_threads():
+    faiss.omp_set_num_threads(FAISS_THREADS)
+    torch.set_num_threads(TORCH_THREADS)
+    try:
+        # Encodes run one large op at a time; extra inter-op threads only contend
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before the first parallel op
+        pass
+
+
+def load_model():
+    if EMBEDDING_BACKEND == "onnx":
+        try:
+            import onnxruntime as ort
+
+            # Full graph fusion (attention, GELU, LayerNorm) on CPU
+            session_options = ort.SessionOptions()
+            session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+            return SentenceTransformer(
+                MODEL_NAME,
+                backend="onnx",
+                model_kwargs={
+                    "file_name": ONNX_MODEL_FILE,
+                    "provider": "CPUExecutionProvider",
+                    "session_options": session_options,
+                }
+            )
+        except Exception as e:
+            # Missing onnxruntime/optimum or model file: keep serving on PyTorch
+            print(f"ONNX backend unavailable ({e}); falling back to PyTorch.")
+
+    return SentenceTransformer(MODEL_NAME).eval()
+
+
+configure_threads()
+model = load_model()
+
+
+def _autocast():
+    # ONNX Runtime ignores torch autocast; its INT8 export is used instead
+    if ENCODER_PRECISION == "bf16" and getattr(model, "backend", "torch") == "torch":
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def encode(texts):
+    """
+    Unit-norm float32 embeddings of texts, one row per text.
+    """
+    # No need to length-sort texts first: encode() already sorts by length
+    # so each mini-batch pads minimally, and restores the input order.
+    # No autograd bookkeeping on the PyTorch path
+    with torch.inference_mode(), _autocast():
+        return model.encode(
+            texts,
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
 
 # ==========================================
 # PRECEDENT DATABASE
@@ -127,92 +252,406 @@ precedents = [
 
 # ==========================================
 # GLOBAL STORAGE
+# corpus_matrix[i] is the unit-norm embedding of precedent i and
+# group_ids[i] its (contract_type, clause_type) group; rows of a group
+# are contiguous, at group_slices[gid]. index is only built for corpora
+# above HNSW_MIN_VECTORS or when CORPUS_QUANTIZATION is "sq8"
 # ==========================================
 
-indexes = {}
-metadata_store = {}
+corpus_matrix = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+corpus_metadata = {}
+index = None
+precedent_texts = np.empty(0, dtype=object)
+group_ids = np.empty(0, dtype=np.int32)
+group_of_key = {}
+group_slices = {}
+
+# clause text -> unit-norm embedding, least recently used first
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
 
 # ==========================================
-# HELPER FUNCTIONS
+# BUILD INDEX (ONCE)
 # ==========================================
 
-def normalize_vectors(vectors):
+def new_index(embeddings):
     """
-    Normalize vectors safely for cosine similarity.
-    Prevents divide-by-zero errors.
+    FAISS index over the corpus, or None when the exact numpy matmul is
+    used instead (FP32 corpora up to HNSW_MIN_VECTORS).
+    All use inner product, i.e. cosine similarity on unit vectors.
     """
-    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
-    norms[norms == 0] = 1
-    return vectors / norms
+    use_hnsw = len(embeddings) > HNSW_MIN_VECTORS
+
+    if CORPUS_QUANTIZATION == "sq8":
+        qtype = faiss.ScalarQuantizer.QT_8bit
+        if use_hnsw:
+            index = faiss.IndexHNSWSQ(EMBEDDING_DIM, qtype, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexScalarQuantizer(EMBEDDING_DIM, qtype, faiss.METRIC_INNER_PRODUCT)
+        # Learns the per-dimension ranges used for quantization
+        index.train(embeddings)
+    elif use_hnsw:
+        index = faiss.IndexHNSWFlat(EMBEDDING_DIM, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    else:
+        return None
+
+    if use_hnsw:
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    index.add(embeddings)
+    return index
+
+
+def _index_metadata(rows):
+    # Anything that changes the embeddings changes the saved file names
+    return {
+        "model": MODEL_NAME,
+        # Backend actually loaded, which differs after an ONNX fallback
+        "backend": getattr(model, "backend", EMBEDDING_BACKEND),
+        "precision": ENCODER_PRECISION,
+        "quantization": CORPUS_QUANTIZATION,
+        "precedents": [list(row) for row in rows],
+    }
+
+
+# Leftover temp files older than this are from crashed writers
+STALE_TMP_SECONDS = 3600
+
+
+def _index_paths(metadata, directory):
+    raw = json.dumps(metadata, sort_keys=True, ensure_ascii=False)
+    name = "precedents_" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+    return (
+        os.path.join(directory, f"{name}.npy"),
+        os.path.join(directory, f"{name}.faiss"),
+        os.path.join(directory, f"{name}.json"),
+    )
 
 
-# ==========================================
-# BUILD INDEXES (ONCE)
-# ==========================================
+def _load_saved_corpus(metadata, directory):
+    """
+    Returns (corpus_matrix, index) saved for exactly this metadata, or None.
+    """
+    corpus_path, index_path, _ = _index_paths(metadata, directory)
+
+    if not os.path.exists(corpus_path):
+        return None
+
+    # Memory-mapped: pages load lazily and are shared between processes.
+    # asarray drops the memmap subclass without copying
+    embeddings = np.asarray(np.load(corpus_path, mmap_mode="r"))
+
+    if os.path.exists(index_path):
+        return embeddings, faiss.read_index(index_path)
+    return embeddings, new_index(embeddings)
+
+
+def _write_atomically(path, write):
+    # Another process may be mmapping the file; never expose a partial one
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
 
-def build_indexes():
-    grouped_data = defaultdict(list)
 
-    # Group precedents by (contract_type, clause_type)
-    for item in precedents:
-        key = (item["contract_type"], item["clause_type"])
-        grouped_data[key].append(item["text"])
+def build_indexes(use_saved=True):
+    """
+    Load the precedent corpus saved in INDEX_DIR for the current
+    precedents and settings; otherwise encode it and save it there.
+    """
+    global corpus_matrix, corpus_metadata, index, precedent_texts, group_ids, group_of_key, group_slices
+
+    # Single pass: group id of every precedent, in first-seen key order
+    group_of_key = {}
+    row_gids = [
+        group_of_key.setdefault((item["contract_type"], item["clause_type"]), len(group_of_key))
+        for item in precedents
+    ]
+
+    # Rows are laid out group by group, in precedent order within a group
+    order = np.argsort(row_gids, kind="stable")
+    group_ids = np.asarray(row_gids, dtype=np.int32)[order]
+    # Object array, so a query's hit texts come out of one fancy-index gather
+    precedent_texts = np.empty(len(order), dtype=object)
+    precedent_texts[:] = [precedents[i]["text"] for i in order]
+    precedent_texts.flags.writeable = False
+
+    bounds = np.searchsorted(group_ids, np.arange(len(group_of_key) + 1)).tolist()
+    group_slices = {gid: slice(bounds[gid], bounds[gid + 1]) for gid in range(len(group_of_key))}
+
+    keys = list(group_of_key)
+    rows = [(*keys[gid], text) for gid, text in zip(group_ids.tolist(), precedent_texts.tolist())]
+    corpus_metadata = _index_metadata(rows)
+
+    saved = _load_saved_corpus(corpus_metadata, INDEX_DIR) if use_saved else None
+
+    if saved is not None:
+        corpus_matrix, index = saved
+    else:
+        # One batched encode straight into a contiguous float32 matrix
+        corpus_matrix = np.ascontiguousarray(encode(precedent_texts.tolist()), dtype=np.float32)
+        # Cheap safety pass; a no-op on vectors that are already unit-norm
+        faiss.normalize_L2(corpus_matrix)
+
+        index = new_index(corpus_matrix)
+
+        if use_saved:
+            try:
+                save_indexes(INDEX_DIR)
+            except OSError as e:
+                # Read-only deployments just re-encode on every start
+                print(f"Could not save precedent corpus to {INDEX_DIR} ({e}).")
+
+    # Shared by every request thread; nothing may write to it
+    corpus_matrix.flags.writeable = False
+
+
+def save_indexes(directory=INDEX_DIR):
+    os.makedirs(directory, exist_ok=True)
 
-    # Build FAISS index for each group
-    for key, texts in grouped_data.items():
-        embeddings = model.encode(texts)
-        embeddings = normalize_vectors(embeddings)
+    corpus_path, index_path, meta_path = _index_paths(corpus_metadata, directory)
+
+    def write_corpus(path):
+        with open(path, "wb") as f:
+            np.save(f, corpus_matrix)
+
+    def write_metadata(path):
+        # Not read back; kept so the files can be inspected
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(corpus_metadata, f, indent=4, ensure_ascii=False)
+
+    if index is not None:
+        _write_atomically(index_path, lambda path: faiss.write_index(index, path))
+    _write_atomically(meta_path, write_metadata)
+    # Written last: its presence is what marks the corpus as saved
+    _write_atomically(corpus_path, write_corpus)
+
+    _prune_saved_indexes(directory, meta_path)
+
+
+def _prune_saved_indexes(directory, current_meta_path):
+    """
+    Remove corpora saved for older precedents under the current encoder
+    settings, plus temp files abandoned by crashed writers. Corpora saved
+    with other settings belong to other processes sharing the directory
+    (the CLI, another deployment) and are kept.
+    """
+    settings = {key: value for key, value in corpus_metadata.items() if key != "precedents"}
+
+    for meta_path in glob.glob(os.path.join(directory, "precedents_*.json")):
+        if meta_path == current_meta_path:
+            continue
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        if {key: value for key, value in saved.items() if key != "precedents"} != settings:
+            continue
 
-        index = faiss.IndexFlatIP(EMBEDDING_DIM)
-        index.add(np.array(embeddings))
+        stem = meta_path[:-len(".json")]
+        # Metadata last, so an interrupted prune is finished by the next one
+        for path in (f"{stem}.npy", f"{stem}.faiss", meta_path):
+            _remove_quietly(path)
 
-        indexes[key] = index
-        metadata_store[key] = texts
+    now = time.time()
+    for path in glob.glob(os.path.join(directory, "precedents_*.tmp")):
+        try:
+            # Younger ones may still be in flight in another process
+            if now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                _remove_quietly(path)
+        except OSError:
+            pass
 
 
-# Build indexes immediately
-build_indexes()
+def _remove_quietly(path):
+    try:
+        # Processes still mmapping an old corpus keep their mapping
+        os.remove(path)
+    except OSError:
+        # Missing, already removed by another process, or locked (Windows)
+        pass
+
+
+if not DEFER_INDEX_BUILD:
+    # Build corpus immediately
+    build_indexes()
 
 
 # ==========================================
 # RETRIEVE SIMILAR CLAUSES
 # ==========================================
 
-def retrieve_similar(clause_text, contract_type, clause_type, top_k=TOP_K):
-    if not clause_text:
-        return []
+def _encode_queries(texts):
+    """
+    (len(texts), EMBEDDING_DIM) unit-norm float32 embeddings. Recently
+    seen texts come from the LRU cache; the rest are encoded in one batch.
+    """
+    found = {}
 
-    key = (contract_type, clause_type)
+    with _embedding_cache_lock:
+        for text in texts:
+            if text in _embedding_cache:
+                _embedding_cache.move_to_end(text)
+                found[text] = _embedding_cache[text]
 
-    if key not in indexes:
-        return []
+    missing = [text for text in dict.fromkeys(texts) if text not in found]
 
-    index = indexes[key]
-    stored_texts = metadata_store[key]
+    if missing:
+        vectors = encode(missing).astype(np.float32, copy=False)
 
-    # Encode query
-    query_vector = model.encode([clause_text])
-    query_vector = normalize_vectors(query_vector)
+        with _embedding_cache_lock:
+            for text, vector in zip(missing, vectors):
+                found[text] = vector
+                # A row view would keep its whole encode batch alive;
+                # an owned copy keeps the LRU bounded by rows
+                _embedding_cache[text] = vector.copy()
 
-    scores, indices = index.search(
-        np.array(query_vector),
-        min(top_k, len(stored_texts))
-    )
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
 
-    results = []
+        # Cold cache, distinct texts: the encoded batch already is the answer
+        if len(missing) == len(texts):
+            return vectors
 
-    for idx, score in zip(indices[0], scores[0]):
-        score = float(score)
+    return np.stack([found[text] for text in texts])
 
-        if score < SIMILARITY_THRESHOLD:
-            continue
 
-        results.append({
-            "text": stored_texts[idx],
-            "score": round(score, 4)
-        })
+def _search_faiss(query_vectors, query_gids, top_k):
+    """
+    One batched search per group. Groups are contiguous row ranges, so
+    each search is restricted to the group's rows directly.
+    """
+    scores = np.full((len(query_vectors), top_k), -np.inf, dtype=np.float32)
+    indices = np.full((len(query_vectors), top_k), -1, dtype=np.int64)
+
+    use_hnsw = isinstance(index, faiss.IndexHNSW)
+    # Flat index over the same (possibly quantized) vectors, for exact scans
+    flat_index = faiss.downcast_index(index.storage) if use_hnsw else index
+
+    for gid in np.unique(query_gids):
+        rows = np.flatnonzero(query_gids == gid)
+        group = group_slices[gid]
+        group_size = group.stop - group.start
+
+        selector = faiss.IDSelectorRange(group.start, group.stop)
+
+        if use_hnsw and group_size > EXACT_GROUP_SIZE:
+            # Visit as many in-group candidates as an unfiltered search would
+            ef_search = min(index.ntotal, HNSW_EF_SEARCH * -(-index.ntotal // group_size))
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+            scores[rows], indices[rows] = index.search(query_vectors[rows], top_k, params=params)
+        elif CORPUS_QUANTIZATION == "sq8":
+            params = faiss.SearchParameters(sel=selector)
+            scores[rows], indices[rows] = flat_index.search(query_vectors[rows], top_k, params=params)
+        else:
+            # The group is one contiguous slice: a single small sgemm
+            group_scores = query_vectors[rows] @ corpus_matrix[group].T
+            k = min(top_k, group_size)
+            top = np.argsort(-group_scores, axis=1, kind="stable")[:, :k]
+            scores[rows, :k] = np.take_along_axis(group_scores, top, axis=1)
+            indices[rows, :k] = top + group.start
+
+    return scores, indices
+
+
+def _search_blocked(query_vectors, query_gids, top_k):
+    """
+    Exact search over SEARCH_BLOCK_SIZE-row corpus blocks, merging each
+    block into a running top_k per query row.
+    """
+    best_scores = np.full((len(query_vectors), top_k), -np.inf, dtype=np.float32)
+    best_indices = np.full((len(query_vectors), top_k), -1, dtype=np.int64)
+
+    for start in range(0, len(corpus_matrix), SEARCH_BLOCK_SIZE):
+        stop = min(start + SEARCH_BLOCK_SIZE, len(corpus_matrix))
+
+        block_scores = query_vectors @ corpus_matrix[start:stop].T
+        block_scores[group_ids[start:stop] != query_gids[:, None]] = -np.inf
+
+        scores = np.concatenate([best_scores, block_scores], axis=1)
+        indices = np.concatenate(
+            [best_indices, np.broadcast_to(np.arange(start, stop), block_scores.shape)],
+            axis=1
+        )
+
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_indices = np.take_along_axis(indices, top, axis=1)
+
+    return best_scores, best_indices
+
+
+def _search(query_vectors, query_gids, top_k=TOP_K):
+    """
+    query_vectors: (n, EMBEDDING_DIM) unit-norm float32 array
+    query_gids: group id each query row is compared against
+
+    Returns (scores, indices) of the best top_k precedents of each row's
+    own group, best first; indices are -1 where the group ran out.
+    """
+    # No-op for encoder output, which is already C-contiguous float32
+    query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+    query_gids = np.asarray(query_gids)
+
+    if index is not None:
+        scores, indices = _search_faiss(query_vectors, query_gids, top_k)
+    elif len(precedent_texts) > BLOCKED_SEARCH_MIN_VECTORS:
+        scores, indices = _search_blocked(query_vectors, query_gids, top_k)
+    else:
+        # Exact: every precedent scored with a single sgemm
+        scores = query_vectors @ corpus_matrix.T
+        indices = np.broadcast_to(np.arange(len(precedent_texts)), scores.shape)
+
+    # Only hits from each query's own (contract_type, clause_type) group count
+    own_group = (indices >= 0) & (group_ids[indices] == query_gids[:, None])
+    scores = np.where(own_group, scores, -np.inf)
 
-    return results
+    k = min(top_k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    top_indices = np.take_along_axis(indices, top, axis=1)
+
+    # Best first; ties keep precedent order
+    order = np.lexsort((top_indices, -top_scores))
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    top_indices = np.take_along_axis(top_indices, order, axis=1)
+
+    return top_scores, np.where(np.isfinite(top_scores), top_indices, -1)
+
+
+def _filter_hits(scores, indices):
+    """
+    Per query row, the hits that clear SIMILARITY_THRESHOLD, best first.
+    One vectorized pass over the whole (n, top_k) search result.
+    """
+    keep = (indices >= 0) & (scores >= SIMILARITY_THRESHOLD)
+
+    # 4-decimal scores as int16 ten-thousandths (cosine fits in +-10000),
+    # turned back into floats only when the dicts are built
+    values = np.rint(scores[keep].astype(np.float64) * 10000).astype(np.int16).tolist()
+    texts = precedent_texts[indices[keep]].tolist()
+    hits = [{"text": text, "score": value / 10000} for text, value in zip(texts, values)]
+
+    # Boolean masking keeps row-major order; split back into rows
+    ends = np.cumsum(keep.sum(axis=1)).tolist()
+    return [hits[start:end] for start, end in zip([0] + ends, ends)]
+
+
+def retrieve_similar(clause_text, contract_type, clause_type, top_k=TOP_K):
+    if not clause_text:
+        return []
+
+    gid = group_of_key.get((contract_type, clause_type))
+    if gid is None:
+        return []
+
+    # Encode query (unit-norm, ready for inner-product search)
+    query_vector = _encode_queries([clause_text])
+
+    scores, indices = _search(query_vector, [gid], top_k)
+    return _filter_hits(scores, indices)[0]
 
 
 # ==========================================
@@ -229,27 +668,70 @@ def process_clauses(clause_list, contract_type):
         List[Dict] enriched with similar clauses
     """
 
-    output = []
+    # Columns are pulled out once instead of .get()-ing each clause per phase
+    numbers = [clause.get("clause_number") for clause in clause_list]
+    texts = [clause.get("clause_text", "") for clause in clause_list]
+    types = [clause.get("clause_type", "Other") for clause in clause_list]
+    confidences = [clause.get("confidence_score") for clause in clause_list]
+    gids = [group_of_key.get((contract_type, clause_type)) for clause_type in types]
+
+    # Distinct (text, group) queries, i.e. distinct (clause_text,
+    # contract_type, clause_type) triples with precedents to compare
+    # against; duplicate clauses share the result
+    queries = list(dict.fromkeys(
+        (text, gid) for text, gid in zip(texts, gids) if text and gid is not None
+    ))
+
+    hits = {}
+
+    if queries:
+        # Phase 1: one batched forward pass over the distinct texts;
+        # repeated boilerplate and texts seen in earlier runs are not
+        # re-encoded
+        unique_texts = list(dict.fromkeys(text for text, _ in queries))
+        vectors = _encode_queries(unique_texts)
+        rows = {text: i for i, text in enumerate(unique_texts)}
+
+        # Usually one query per distinct text, in order: search the
+        # encoded batch as is instead of gathering a copy
+        query_rows = [rows[text] for text, _ in queries]
+        if query_rows != list(range(len(vectors))):
+            vectors = vectors[query_rows]
+
+        # Phase 2: one batched top-k; each query only ranks precedents of
+        # its own group
+        scores, indices = _search(vectors, [gid for _, gid in queries])
+        hits = dict(zip(queries, _filter_hits(scores, indices)))
+
+    return [
+        {
+            "clause_number": number,
+            "clause": text,
+            "clause_type": clause_type,
+            "confidence_score": confidence,
+            "similar_clauses": hits.get((text, gid), [])
+        }
+        for number, text, clause_type, confidence, gid
+        in zip(numbers, texts, types, confidences, gids)
+    ]
 
-    for clause in clause_list:
-        clause_text = clause.get("clause_text", "")
-        clause_type = clause.get("clause_type", "Other")
 
-        similar_clauses = retrieve_similar(
-            clause_text,
-            contract_type,
-            clause_type
-        )
+# ==========================================
+# BACKGROUND WARM-UP
+# ==========================================
+
+def _warm_up():
+    # Run a batched forward pass and one search off the request path while
+    # the app finishes loading; the first of each pays for weight
+    # materialization and BLAS / FAISS thread-pool start-up
+    query_vectors = encode(["warm up"] * 2)
+    if group_of_key:
+        _search(query_vectors, [0, 0])
 
-        output.append({
-            "clause_number": clause.get("clause_number"),
-            "clause": clause_text,
-            "clause_type": clause_type,
-            "confidence_score": clause.get("confidence_score"),
-            "similar_clauses": similar_clauses
-        })
 
-    return output
+# Started last so it never competes with build_indexes() for the model
+if not DEFER_INDEX_BUILD:
+    threading.Thread(target=_warm_up, daemon=True).start()
 
 
 # ==========================================